@@ -1,5 +1,5 @@
 import importlib
-from typing import List, Optional, TypeVar, Type
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, TypeVar, Type
 
 from wai.lazypip import require_module, install_packages
 
@@ -50,3 +50,45 @@ def load_class(
         raise Exception(f"'{class_name}' is not a sub-class of {required_type.__qualname__}")
 
     return cls
+
+
+class LazyClassMapping(Mapping[str, Type[ClassType]]):
+    """
+    Maps names to classes, only loading each class (via load_class) when it
+    is first looked up, rather than importing every class up-front.
+    """
+    def __init__(
+            self,
+            class_specs: Dict[str, Tuple[str, str]],
+            required_type: Type[ClassType] = object,
+            debug: bool = False
+    ):
+        """
+        :param class_specs: the class name and required package for each name
+        :param required_type: the required type of the loaded classes
+        :param debug: whether to output debugging information
+        """
+        self._class_specs = class_specs
+        self._required_type = required_type
+        self._debug = debug
+        self._loaded: Dict[str, Type[ClassType]] = {}
+
+    def __getitem__(self, name: str) -> Type[ClassType]:
+        if name not in self._loaded:
+            class_name, package = self._class_specs[name]
+            self._loaded[name] = load_class(
+                class_name,
+                self._required_type,
+                required_packages=[package],
+                debug=self._debug
+            )
+        return self._loaded[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._class_specs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._class_specs)
+
+    def __len__(self) -> int:
+        return len(self._class_specs)
@@ -24,8 +24,8 @@ class UFDLJobLauncherConfig:
         if not os.path.exists(config_file):
             raise Exception(f"Config file '{config_file}' does not exist!")
 
-        # Do the raw parse of the config file
-        config = configparser.ConfigParser()
+        # Do the raw parse of the config file (no interpolation, as we don't use it)
+        config = configparser.ConfigParser(interpolation=None)
         config.read(config_file)
 
         # Parse the individual sections of the configuration file
@@ -1,6 +1,7 @@
 """
 Utilities for converting raw string values into more useful types.
 """
+from functools import lru_cache, partial
 from typing import Callable, Iterable, List, Optional, TypeVar
 
 DEFAULT_TRUE_SET = frozenset((
@@ -63,9 +64,11 @@ def str2bool(
         )
 
 
+@lru_cache(maxsize=128)
 def normalise(string: str) -> str:
     """
-    Normalises a string for case-insensitive, stripped comparison.
+    Normalises a string for case-insensitive, stripped comparison. Results
+    are cached, as the same few keywords are normalised repeatedly.
 
     :param string:
                 The string to normalise.
@@ -79,6 +82,26 @@ ElementType = TypeVar('ElementType')
 """The type of elements in a list."""
 
 
+def _split_and_convert(
+        convert: Callable[[str], ElementType],
+        sep: Optional[str],
+        string: str
+) -> List[ElementType]:
+    """
+    Splits a string into sub-strings and converts each of them.
+
+    :param convert:
+                The function to use to convert each element of the list.
+    :param sep:
+                The separator of sub-strings in the list.
+    :param string:
+                The [sep]-separated string of strings to convert.
+    :return:
+                The list of converted elements.
+    """
+    return list(map(convert, string.split(sep)))
+
+
 def list_of(
         convert: Callable[[str], ElementType],
         sep: Optional[str] = None
@@ -94,15 +117,7 @@ def list_of(
                 A function which takes a [sep]-separated string of strings,
                 and converts it into a list of converted elements.
     """
-    def convert_list(
-            string: str
-    ) -> List[ElementType]:
-        return [
-            convert(element)
-            for element in string.split(sep)
-        ]
-
-    return convert_list
+    return partial(_split_and_convert, convert, sep)
 
 
 ValueType = TypeVar('ValueType')
@@ -124,6 +139,9 @@ def enum_of(
     :return:
                 Function which converts the raw value and checks it is in the enumeration.
     """
+    # Hash the allowed values once, for constant-time membership checks
+    allowed_set = frozenset(allowed_values)
+
     def convert_enum(
             string: str
     ) -> ValueType:
@@ -131,7 +149,7 @@ def enum_of(
         converted = convert(string)
 
         # Ensure the converted value is in the enumerated set
-        if converted not in allowed_values:
+        if converted not in allowed_set:
             raise ValueError(
                 f"'{converted}' (parsed from '{string}') is not one of:\n"
                 f"{allowed_values}"
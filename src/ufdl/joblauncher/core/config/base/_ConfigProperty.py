@@ -42,7 +42,8 @@ class ConfigProperty(Generic[ValueType]):
     def convert(self, value: Optional[str]) -> ValueType:
         """
         Converts the raw string value to the property's value-type, or provides
-        the default if no value is given.
+        the default if no value is given. Once the property is bound to its owning
+        section, this is replaced by a version specialised to the property.
 
         :param value:
                     The raw string value to convert.
@@ -53,28 +54,7 @@ class ConfigProperty(Generic[ValueType]):
         """
         # If a value is given, convert it
         if value is not None:
-            # Handle environment variable substitution
-            while True:
-                # See if there is another variable to substitute, breaking if not
-                environment_match = ENVIRONMENT_PATTERN.search(value)
-                if environment_match is None:
-                    break
-
-                # Get the name of the environment variable
-                environment_variable = environment_match[1]
-
-                # Get the value of the variable from the environment, ensuring it exists
-                replacement = environ.get(environment_variable, None)
-                if replacement is None:
-                    raise Exception(
-                        f"No variable '{environment_variable}' found in environment, "
-                        f"expected by property '{self._name}'"
-                    )
-
-                # Replace the variable with its value
-                value.replace(environment_match[0], replacement)
-
-            return self._convert(value)
+            return self._convert_value(value)
 
         # If this property is required, raise the fact that no value was given
         if self._default is None:
@@ -82,6 +62,74 @@ class ConfigProperty(Generic[ValueType]):
 
         return self._default
 
+    def _convert_required(self, value: Optional[str]) -> ValueType:
+        """
+        Specialisation of convert for properties without a default.
+        """
+        if value is None:
+            raise Exception(f"No value specified for non-optional property '{self._name}'")
+
+        return self._convert_value(value)
+
+    def _convert_optional(self, value: Optional[str]) -> ValueType:
+        """
+        Specialisation of convert for properties with a default.
+        """
+        if value is None:
+            return self._default
+
+        return self._convert_value(value)
+
+    def _convert_value(self, value: str) -> ValueType:
+        """
+        Converts a given raw string value to the property's value-type.
+
+        :param value:
+                    The raw string value to convert.
+        :return:
+                    The convert value.
+        """
+        value = self._substitute_environment(value)
+
+        # The raw value is already a string, so no conversion is necessary
+        if self._convert is str:
+            return value
+
+        return self._convert(value)
+
+    def _substitute_environment(self, value: str) -> str:
+        """
+        Substitutes any environment variables (enclosed in ${}) in the raw value.
+
+        :param value:
+                    The raw string value.
+        :return:
+                    The value with all environment variables substituted.
+        :raises Exception:
+                    If a referenced variable is not in the environment.
+        """
+        while True:
+            # See if there is another variable to substitute, breaking if not
+            environment_match = ENVIRONMENT_PATTERN.search(value)
+            if environment_match is None:
+                break
+
+            # Get the name of the environment variable
+            environment_variable = environment_match[1]
+
+            # Get the value of the variable from the environment, ensuring it exists
+            replacement = environ.get(environment_variable, None)
+            if replacement is None:
+                raise Exception(
+                    f"No variable '{environment_variable}' found in environment, "
+                    f"expected by property '{self._name}'"
+                )
+
+            # Replace the variable with its value
+            value = value.replace(environment_match[0], replacement)
+
+        return value
+
     def __get__(self, instance: 'ConfigSection', owner: Type['ConfigSection']) -> ValueType:
         """
         Gets the (converted) value of this property from the parsed section instance.
@@ -122,3 +170,6 @@ class ConfigProperty(Generic[ValueType]):
 
         self._name = name
         self._owner = owner
+
+        # Now that the property is fixed, specialise conversion on whether it is optional
+        self.convert = self._convert_required if self._default is None else self._convert_optional
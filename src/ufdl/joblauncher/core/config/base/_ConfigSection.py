@@ -8,6 +8,21 @@ class ConfigSection:
     """
     Base class for sections of the job-launcher's configuration file.
     """
+    # The properties of the section, by name (populated at class-creation time)
+    _CONFIG_PROPERTIES: Dict[str, ConfigProperty] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Walk the MRO (base-most first) so that sub-classes override the
+        # properties of any of their bases
+        properties: Dict[str, ConfigProperty] = {}
+        for klass in reversed(cls.__mro__):
+            for attr_name, attr in vars(klass).items():
+                if isinstance(attr, ConfigProperty):
+                    properties[attr_name] = attr
+        cls._CONFIG_PROPERTIES = properties
+
     def __init__(
             self,
             name: str,
@@ -58,10 +73,12 @@ class ConfigSection:
         )
 
         # Check the section is in the raw config-file
-        if section_name not in raw.sections():
+        if not raw.has_section(section_name):
             raise Exception(f"{header}: missing section '{section_name}'")
 
-        section_values = raw[section_name]
+        # Take a plain copy of the section's raw values, so lookups don't go
+        # through the section-proxy's interpolation/key-normalisation
+        section_values: Dict[str, str] = dict(raw.items(section_name, raw=True))
         converted_values: Dict[str, Any] = {}
 
         # Locate and convert each of our properties
@@ -87,9 +104,4 @@ class ConfigSection:
         """
         Gets all the properties of this section.
         """
-        return {
-            attr_name: attr
-            for attr_name in dir(cls)
-            for attr in (getattr(cls, attr_name),)
-            if isinstance(attr, ConfigProperty)
-        }
+        return cls._CONFIG_PROPERTIES
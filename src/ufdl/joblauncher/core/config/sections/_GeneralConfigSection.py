@@ -14,6 +14,8 @@ class GeneralConfigSection(ConfigSection):
     keep_job_dirs: bool = ConfigProperty(str2bool)
     pip_no_cache: bool = ConfigProperty(str2bool)
     compression: int = ConfigProperty(int)
+    compresslevel: int = ConfigProperty(int, default=6)
+    max_log_output: int = ConfigProperty(int, default=65536)
     poll: str = ConfigProperty(enum_of(str, "simple"))
     gpu_id: int = ConfigProperty(int)
     cancel_check_wait: int = ConfigProperty(int)
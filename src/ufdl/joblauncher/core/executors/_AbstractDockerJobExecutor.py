@@ -1,9 +1,13 @@
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import lru_cache
 import getpass
 import os
 import re
 from subprocess import CompletedProcess
+import threading
+import traceback
 from abc import abstractmethod
-from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Match, Optional, Tuple, Union
 
 from ufdl.jobtypes.base import String, UFDLJSONType
 from ufdl.jobtypes.standard import PK, Name
@@ -18,7 +22,7 @@ from ..config import UFDLJobLauncherConfig
 from ..types import Job, Template
 from .._logging import logger
 from .._node import HardwareInfo
-from .descriptors import Parameter
+from .descriptors import InstanceDescriptorProxy, Parameter
 from .parsers import CommandProgressParser
 from ._AbstractJobExecutor import AbstractJobExecutor
 from ._types import ContractType
@@ -33,16 +37,110 @@ KEY_REGISTRY_USERNAME = 'registry_username'
 
 KEY_REGISTRY_URL = 'registry_url'
 
-# Regular expression which matches a boolean parameter replacement string
-BOOL_TEMPLATE_PATTERN: str = '''
-    \\$\\{                      # Opening brace
-    (?P<use_case>[+-])          # Whether to use the value on true/false 
-    (?P<param_name>.+)          # The name of the boolean parameter
-    :                           # Colon
-    (?P<value>.*)               # The string to use when the parameter is false
-    \\}                         # Closing brace
-    '''
-BOOL_TEMPLATE_MATCHER = re.compile(BOOL_TEMPLATE_PATTERN, re.VERBOSE)
+# Regular expression which matches a boolean parameter replacement string,
+# e.g. ${+param_name:value} or ${-param_name:value}, where the value is used
+# when the parameter is true (+) or false (-). The value may itself contain
+# plain replacement strings, e.g. ${-gpu:--cpu ${threads}}
+BOOL_TEMPLATE_PATTERN: str = (
+    r"\$\{(?P<use_case>[+-])(?P<param_name>[^:}]+):"
+    r"(?P<value>(?:\$\{[^}]*\}|[^}$]|\$(?!\{))*)\}"
+)
+BOOL_TEMPLATE_MATCHER = re.compile(BOOL_TEMPLATE_PATTERN)
+
+# Regular expression which matches any parameter replacement string, either
+# boolean (see above) or a plain ${param_name}
+TEMPLATE_MATCHER = re.compile(f"{BOOL_TEMPLATE_PATTERN}|\\$\\{{(?P<name>[^}}]+)\\}}")
+
+
+@lru_cache(maxsize=256)
+def parse_template_string(string: str) -> Tuple[Union[str, Match], ...]:
+    """
+    Splits a template string into its literal text and the parameter replacement
+    strings between them. Template strings are generally re-used by many jobs, so
+    the parsed form is cached.
+
+    :param string: the template string to parse
+    :return: the literal strings and replacement-string matches, in order
+    """
+    segments: List[Union[str, Match]] = []
+    position = 0
+    for match in TEMPLATE_MATCHER.finditer(string):
+        if match.start() > position:
+            segments.append(string[position:match.start()])
+        segments.append(match)
+        position = match.end()
+    if position < len(string):
+        segments.append(string[position:])
+
+    return tuple(segments)
+
+
+def expand_template_string(string: str, parameter_values: Dict[str, Any]) -> Optional[str]:
+    """
+    Expands the parameters in a template string. Bool parameters use the true/false
+    replacements defined in the template itself, other types are replaced with their
+    string representation. References to unknown parameters are left as-is.
+
+    :param string: the template string to expand
+    :param parameter_values: the values of the parameters, by name
+    :return: the expanded string, or None if the string was emptied by a bool replacement
+    """
+    parts: List[str] = []
+    bool_replaced = False
+    for segment in parse_template_string(string):
+        if isinstance(segment, str):
+            parts.append(segment)
+            continue
+
+        # Bool replacement string
+        name = segment.group('param_name')
+        if name is not None:
+            value = parameter_values.get(name, None)
+            if isinstance(value, bool):
+                use_case = segment.group('use_case') == '+'
+                if use_case == value:
+                    # The chosen value may contain replacement strings of its own
+                    chosen = expand_template_string(segment.group('value'), parameter_values)
+                    parts.append(chosen if chosen is not None else "")
+                bool_replaced = True
+                continue
+
+        # Plain replacement string
+        else:
+            name = segment.group('name')
+            if name in parameter_values and not isinstance(parameter_values[name], bool):
+                parts.append(str(parameter_values[name]))
+                continue
+
+        # Not one of our parameters
+        parts.append(segment.group(0))
+
+    expanded = "".join(parts)
+
+    # Strings which are emptied by a bool replacement are removed
+    return None if expanded == "" and string != "" and bool_replaced else expanded
+
+# Regular expression which matches the output of 'docker --version'
+DOCKER_VERSION_MATCHER = re.compile(r"^Docker version (?P<major_minor>\d+\.\d+)(?P<patch>[^,\s]*)")
+
+
+# The version of the docker client, with and without the patch version. As this doesn't
+# change while the job-launcher is running, it is only determined once (successfully) per process
+_DOCKER_VERSIONS: Dict[bool, str] = {}
+
+
+@lru_cache(maxsize=1)
+def current_user_flags() -> List[str]:
+    """
+    Returns the docker flags for running a container as the current user. As the
+    user can't change while the job-launcher is running, these are only determined once.
+
+    :return: the list of flags
+    """
+    return [
+        "-u", f"{os.getuid()}:{os.getgid()}",
+        "-e", f"USER={getpass.getuser()}",
+    ]
 
 
 class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
@@ -55,6 +153,9 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         Array(String())
     )
 
+    # The docker image to execute the job, whose type depends on the contract (see __init__)
+    docker_image = InstanceDescriptorProxy("docker_image")
+
     def __init__(
             self,
             context: UFDLServerContext,
@@ -76,6 +177,9 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         self._use_gpu = False
         self._gpu_id = config.general.gpu_id
         self._additional_gpu_flags = []
+        self._image_pull: Optional[Future] = None
+        self._image_pull_stop = threading.Event()
+        self._runtime_gpu_flag_list: Optional[List[str]] = None
 
         if docker_image_type is None:
             docker_image_type = self._extract_docker_image_type_from_contract(self._contract)
@@ -125,30 +229,47 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         :param include_patch: whether to include the patch version as well next to major/minor
         :return: the version string, None if failed to obtain
         """
+        if include_patch in _DOCKER_VERSIONS:
+            self.log_msg("Docker version (determined by an earlier job):", _DOCKER_VERSIONS[True])
+            return _DOCKER_VERSIONS[include_patch]
 
         res = self._execute(["docker", "--version"], no_sudo=True, capture_output=True)
-        if res.returncode > 0:
+        if res.returncode > 0 or not res.stdout:
             return None
 
         stdout = res.stdout
-
-        if stdout is None:
+        match = DOCKER_VERSION_MATCHER.match(
+            (stdout.decode() if isinstance(stdout, bytes) else stdout if isinstance(stdout, str) else stdout[0]).strip()
+        )
+        if match is None:
             return None
 
-        result = (
-            stdout.decode() if isinstance(stdout, bytes)
-            else stdout if isinstance(stdout, str)
-            else stdout[0]
-        ).strip()
-        if result.startswith("Docker version"):
-            result = result.replace("Docker version ", "")
-        if "," in result:
-            result = result.split(",")[0]
-        if not include_patch:
-            if "." in result:
-                parts = result.split(".")
-                if len(parts) >= 2:
-                    result = parts[0] + "." + parts[1]
+        # Only successful look-ups are cached, so a failure is retried by the next job
+        _DOCKER_VERSIONS[False] = match.group('major_minor')
+        _DOCKER_VERSIONS[True] = match.group('major_minor') + match.group('patch')
+
+        return _DOCKER_VERSIONS[include_patch]
+
+    def _runtime_gpu_flags(self) -> List[str]:
+        """
+        Returns the flags for enabling the GPU in the docker runtime, which
+        depend on the docker version.
+
+        :return: the list of flags
+        """
+        result: List[str] = []
+
+        version = self._version(include_patch=False)
+        if version is not None:
+            version_num = float(version)
+            if version_num >= 19.03:
+                result.append('--gpus="device=%s"' % str(self.gpu_id))
+            else:
+                result.append("--runtime=nvidia")
+        else:
+            message = "Failed to determine the docker version, not adding the docker GPU runtime flags!"
+            logger().warning(message)
+            self.log_msg(message)
 
         return result
 
@@ -159,19 +280,14 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
 
         :return: the list of flags, empty list if none required
         """
-        result: List[str] = []
+        if not self._use_gpu:
+            return []
 
-        if self._use_gpu:
-            version = self._version(include_patch=False)
-            if version is not None:
-                version_num = float(version)
-                if version_num >= 19.03:
-                    result.append('--gpus="device=%s"' % str(self.gpu_id))
-                else:
-                    result.append("--runtime=nvidia")
-            result.extend(self._additional_gpu_flags)
+        # Normally determined in pre-run, as they don't change during the job
+        if self._runtime_gpu_flag_list is None:
+            self._runtime_gpu_flag_list = self._runtime_gpu_flags()
 
-        return result
+        return self._runtime_gpu_flag_list + self._additional_gpu_flags
 
     def _registry_login_required(self) -> bool:
         """
@@ -204,14 +320,97 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         """
         return self._execute(["docker", "logout", registry], always_return=False)
 
-    def _pull_image(self, image: str) -> Optional[CompletedProcess]:
+    def _pull_image(self, image: str, stop: Optional[threading.Event] = None) -> Optional[CompletedProcess]:
         """
         Pulls the requested image.
 
         :param image: the image to pull
+        :param stop: an event which stops the pull once set, if any
         :return: None if successfully pulled, otherwise subprocess.CompletedProcess
         """
-        return self._execute(["docker", "pull", image], always_return=False)
+        # Images pinned to a digest are immutable, so a local copy is always up-to-date
+        if "@sha256:" in image and self._image_present(image):
+            self.log_msg("Image pinned by digest already present, skipping pull:", image)
+            return None
+
+        return self._execute(["docker", "pull", image], always_return=False, stop=stop)
+
+    def _image_present(self, image: str) -> bool:
+        """
+        Checks whether the image is already available locally.
+
+        :param image: the image to check for
+        :return: True if the image is present
+        """
+        return self._execute(["docker", "image", "inspect", "--format", "{{.Id}}", image]).returncode == 0
+
+    def _pull_image_in_background(self, image: str) -> None:
+        """
+        Starts pulling the requested image in a background thread, so that other
+        preparation (e.g. downloading datasets) can happen in the meantime.
+        Use _wait_for_image_pull to wait for the pull to complete.
+
+        :param image: the image to pull
+        """
+        pool = ThreadPoolExecutor(max_workers=1)
+        self._image_pull = pool.submit(self._pull_image, image, self._image_pull_stop)
+        pool.shutdown(wait=False)
+
+    def _wait_for_image_pull(self) -> None:
+        """
+        Waits for any background image pull to complete, raising an
+        exception if it failed.
+        """
+        if self._image_pull is None:
+            return
+
+        image_pull, self._image_pull = self._image_pull, None
+        self._fail_on_error(image_pull.result())
+
+    @staticmethod
+    def _contains_any(template_str: Union[str, Tuple[str, ...]], *tokens: str) -> bool:
+        """
+        Checks whether any of the tokens occur in the template string(s).
+
+        :param template_str: the template string, or tuple of template strings, to check
+        :param tokens: the tokens to look for
+        :return: True if at least one token occurs in the template
+        """
+        strings = (template_str,) if isinstance(template_str, str) else template_str
+        return any(
+            token in string
+            for string in strings
+            for token in tokens
+        )
+
+    @staticmethod
+    def _apply_replacer(
+            template_str: Union[str, Tuple[str, ...]],
+            replacer: Callable[[str], Optional[str]]
+    ) -> Union[str, Tuple[str, ...]]:
+        """
+        Applies a replacement function to the template string(s). Strings for which
+        the replacer returns None are removed (or emptied, if a single string).
+
+        :param template_str: the template string, or tuple of template strings
+        :param replacer: the replacement function to apply to each string
+        :return: the replaced template string(s)
+        """
+        if isinstance(template_str, str):
+            result = replacer(template_str)
+            return result if result is not None else ""
+
+        # Only replace each distinct string once
+        replaced: Dict[str, Optional[str]] = {
+            string: replacer(string)
+            for string in set(template_str)
+        }
+
+        return tuple(
+            replaced_string
+            for replaced_string in (replaced[string] for string in template_str)
+            if replaced_string is not None
+        )
 
     def _expand_parameters(
             self,
@@ -232,59 +431,33 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         """
         result = template_str
 
+        # Nothing to expand if the template contains no parameter references
+        if not self._contains_any(result, "${"):
+            return result
+
         # Get the defined parameters and their values
-        parameter_values = {
+        defined_values = {
             parameter: getattr(self, parameter)
             for parameter, is_template_defined in self._parameters()
             if is_template_defined
         }
 
-        # Parse any additional template-defined parameters
-        parameter_values.update({
-            parameter: Parameter.parse_parameter(parameter, (UFDLJSONType(),), self)
-            for parameter in self.template['parameters']
-            if parameter not in parameter_values
-        })
-
-        # Add in the given additional expansions
-        if additional_expansions is not None:
-            parameter_values.update({
-                parameter: value
-                for parameter, value in additional_expansions.items()
-                if parameter not in parameter_values
-            })
-
-        for parameter, value in parameter_values.items():
-            # Bool parameters have the true/false replacements defined in the body itself
-            if isinstance(value, bool):
-                def replacer(string: str) -> Optional[str]:
-                    matches = list(BOOL_TEMPLATE_MATCHER.finditer(string))
-                    for match in reversed(matches):
-                        if match.group('param_name') == parameter:
-                            use_case = True if match.group('use_case') == '+' else False
-                            replacement = match.group('value') if use_case == value else ""
-                            string = f"{string[:match.start()]}{replacement}{string[match.end():]}"
-                            if string == "":
-                                return None
-                    return string
-
-            # Other types just replace the parameter name with its string representation
-            else:
-                def replacer(string: str) -> str:
-                    return string.replace("${" + parameter + "}", str(value))
-
-            if isinstance(result, str):
-                result = replacer(result)
-                if result is None:
-                    result = ""
-            else:  # result: Tuple[str, ...]
-                result = tuple(
-                    replaced_string
-                    for replaced_string in (replacer(string) for string in result)
-                    if replaced_string is not None
-                )
+        # Merge in any additional template-defined parameters and the given additional
+        # expansions, in increasing order of precedence (later keys win)
+        parameter_values = {
+            **(additional_expansions if additional_expansions is not None else {}),
+            **{
+                parameter: Parameter.parse_parameter(parameter, (UFDLJSONType(),), self)
+                for parameter in self.template['parameters']
+                if parameter not in defined_values
+            },
+            **defined_values
+        }
 
-        return result
+        def replacer(string: str) -> Optional[str]:
+            return expand_template_string(string, parameter_values)
+
+        return self._apply_replacer(result, replacer)
 
     def _expand_template(
             self,
@@ -331,23 +504,26 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         :return:
                     None if successfully executed, otherwise subprocess.CompletedProcess.
         """
-        cmd = ["docker", "run"]
-        if docker_args is not None:
-            cmd.extend(docker_args)
-        if remove_container_on_exit and "--rm" not in cmd:
-            cmd.append("--rm")
-        cmd.extend(self._gpu_flags())
-        if self.use_current_user:
-            cmd.extend([
-                "-u", f"{os.getuid()}:{os.getgid()}",
-                "-e", f"USER={getpass.getuser()}",
-            ])
-        if volumes is not None:
-            for volume in volumes:
-                cmd.extend(["-v", volume])
-        cmd.append(image)
-        if image_args is not None:
-            cmd.extend(image_args)
+        self._wait_for_image_pull()
+
+        docker_args = list(docker_args) if docker_args is not None else []
+        remove_flag = ["--rm"] if remove_container_on_exit and "--rm" not in docker_args else []
+        user_flags = current_user_flags() if self.use_current_user else []
+        volume_flags = [
+            flag
+            for volume in (volumes if volumes is not None else ())
+            for flag in ("-v", volume)
+        ]
+        cmd = [
+            "docker", "run",
+            *docker_args,
+            *remove_flag,
+            *self._gpu_flags(),
+            *user_flags,
+            *volume_flags,
+            image,
+            *(image_args if image_args is not None else ())
+        ]
         return self._execute(cmd, always_return=False, command_progress_parser=command_progress_parser)
 
     def _pre_run(self) -> bool:
@@ -368,10 +544,19 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
             if res is not None:
                 logger().fatal("Failed to log into registry")
                 raise Exception(self._to_logentry(res, [self.docker_image[KEY_REGISTRY_USERNAME], self.docker_image[KEY_REGISTRY_PASSWORD]]))
-        self._use_gpu = not (str(self.docker_image[KEY_CPU]).lower() == "true")
-        self._fail_on_error(self._pull_image(self.docker_image[KEY_IMAGE_URL]))
+        self._use_gpu = not self.docker_image[KEY_CPU]
+        if self._use_gpu:
+            self._runtime_gpu_flag_list = self._runtime_gpu_flags()
+        self._pull_image_in_background(self.docker_image[KEY_IMAGE_URL])
         return True
 
+    def _complete_pre_run(self) -> None:
+        """
+        Waits for the image pull started in pre-run, failing the pre-run if it failed.
+        """
+        super()._complete_pre_run()
+        self._wait_for_image_pull()
+
     def _post_run(self, pre_run_success: bool, do_run_success: bool, error: Optional[str]) -> None:
         """
         Hook method after the actual job has been run. Will always be executed.
@@ -380,6 +565,21 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         :param do_run_success: whether the do_run code was successfully run (only gets run if pre-run was successful)
         :param error: any error that may have occurred, None if none occurred
         """
+        # A background image pull still pending here (i.e. pre-run failed) is no longer
+        # required, so stop it, but make sure it is done before logging out
+        if self._image_pull is not None:
+            image_pull, self._image_pull = self._image_pull, None
+            if not image_pull.done():
+                self.log_msg("Stopping background image pull")
+                self._image_pull_stop.set()
+            wait([image_pull])
+            exception = image_pull.exception()
+            if exception is not None:
+                self.log_msg(
+                    f"Background image pull failed:\n"
+                    f"{''.join(traceback.format_exception(type(exception), exception, exception.__traceback__))}"
+                )
+
         if self.docker_image is not None:
             if self._registry_login_required():
                 self._logout_registry(self.docker_image.registry_url)
@@ -398,6 +598,9 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         if super_reason is not None:
             return super_reason
 
+        # Resolve the docker image once, rather than via the parameter descriptor on every check
+        docker_image = self.docker_image
+
         # If we have no GPU or compatible software, the image must be CPU-runnable
         no_gpu_reason = (
             f"Node has no GPUs" if hardware_info.gpus is None or len(hardware_info.gpus) == 0
@@ -408,21 +611,21 @@ class AbstractDockerJobExecutor(AbstractJobExecutor[ContractType]):
         )
         if no_gpu_reason is not None:
             return (
-                f"{no_gpu_reason} and Docker image is not CPU-only" if not self.docker_image.cpu
+                f"{no_gpu_reason} and Docker image is not CPU-only" if not docker_image.cpu
                 else None
             )
 
         # Make sure the node supports the CUDA version and driver version
-        cuda = self.docker_image.cuda_version
+        cuda = docker_image.cuda_version
         if cuda.version > hardware_info.cuda:
             return f"Node's CUDA version ({hardware_info.cuda}) is too low for Docker image (requires >= {cuda.version})"
         elif cuda.min_driver_version > hardware_info.driver:
             return f"Node's driver version ({hardware_info.driver}) is too low for Docker image (requires >= {cuda.min_driver_version})"
 
         # Make sure our hardware is up-to-date
-        min_hardware_generation = self.docker_image.min_hardware_generation
+        min_hardware_generation = docker_image.min_hardware_generation
         if min_hardware_generation is not None and min_hardware_generation.min_compute_capability > hardware_info.gpus[0].compute:
             return f"Node's GPU compute capability ({hardware_info.gpus[0].compute}) is too low " \
-                   f"for Docker image (requires >= {self.docker_image.min_hardware_generation.min_compute_capability})"
+                   f"for Docker image (requires >= {min_hardware_generation.min_compute_capability})"
 
         return None
@@ -1,30 +1,36 @@
+import codecs
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
 import json
 import os
-from requests.exceptions import HTTPError
+import re
+import selectors
+import io
+from requests.exceptions import ConnectionError, HTTPError
 import shutil
 import subprocess
+import sys
 from subprocess import CompletedProcess
 import tempfile
+import threading
+import time
 import traceback
-from typing import Any, Dict, Generic, Iterator, Optional, Tuple, Union, List
-from zipfile import ZipFile
+from typing import Any, BinaryIO, Dict, Generic, Iterator, Optional, Pattern, Tuple, Union, List
+from zipfile import ZipFile, ZIP_STORED
 
 from ufdl.jobcontracts.base import UFDLJobContract, Input, Output
 from ufdl.jobcontracts.initialise import initialise_server as initialise_contracts
-from ufdl.jobcontracts.util import parse_contract
 
 from ufdl.jobtypes.base import UFDLType, UFDLJSONType, InputType, OutputType
 from ufdl.jobtypes.initialise import (
     initialise_server as initialise_types,
 )
 from ufdl.jobtypes.standard.util import Compressed, JSON
-from ufdl.jobtypes.util import parse_type
 
 from ufdl.json.core.filter import FilterSpec
 
 from ufdl.pythonclient import UFDLServerContext
-from ufdl.pythonclient.functional.core.nodes.node import ping as node_ping
 from ufdl.pythonclient.functional.core.jobs.job import add_output as job_add_output, retrieve as job_retrieve
 from ufdl.pythonclient.functional.core.jobs.job import acquire_job, start_job, finish_job, progress_job
 
@@ -35,11 +41,55 @@ from ..config import UFDLJobLauncherConfig
 from ..types import Job, Template
 from .._logging import logger
 from .._node import get_ipv4, HardwareInfo
-from .._utils import load_class
-from .descriptors import ExtraOutput, Parameter
+from .._utils import LazyClassMapping
+from .descriptors import ExtraOutput, InstanceDescriptorProxy, Parameter
 from .parsers import CommandProgressParser
+from ._parsing import cached_parse_contract, cached_parse_type
 from ._types import ContractType
 
+# The extensions of file formats which are already compressed, so gain nothing from
+# being compressed again when added to a zip file
+ALREADY_COMPRESSED_EXTENSIONS = frozenset((
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".zst",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp3", ".mp4", ".avi", ".mkv",
+    # PyTorch checkpoints are zip containers of mostly incompressible float weights
+    ".pth", ".pt"
+))
+
+# Files with timestamps zip can't represent (before 1980) are clamped rather than failing
+# the compression. N.B. only available from Python 3.8; earlier versions still fail on these
+_ZIP_TIMESTAMP_OPTIONS: Dict[str, Any] = {"strict_timestamps": False} if sys.version_info >= (3, 8) else {}
+
+# Removes finished jobs' directories in the background, so the launcher can move on to
+# the next job straight away. Pending removals are completed before the interpreter exits
+_CLEANUP_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ufdl-cleanup")
+
+# The job-type and job-contract classes known to each server (by host). These only change
+# when the server is updated, so are loaded once per launcher process rather than per job
+_KNOWN_TYPES_AND_CONTRACTS: Dict[str, Tuple[LazyClassMapping[UFDLType], LazyClassMapping[UFDLJobContract]]] = {}
+
+
+@lru_cache(maxsize=None)
+def _instance_descriptor_subclass(cls: type, name: str) -> type:
+    """
+    Gets a private sub-class of an executor class which declares an InstanceDescriptorProxy
+    for the given name, for instances which assign a descriptor to a name their class
+    doesn't declare a proxy for.
+
+    :param cls: the executor class
+    :param name: the attribute name the descriptor is assigned to
+    :return: the sub-class
+    """
+    return type(
+        cls.__name__,
+        (cls,),
+        {
+            name: InstanceDescriptorProxy(name),
+            '__module__': cls.__module__,
+            '__qualname__': cls.__qualname__
+        }
+    )
+
 
 class AbstractJobExecutor(Generic[ContractType]):
     """
@@ -47,10 +97,67 @@ class AbstractJobExecutor(Generic[ContractType]):
     """
     _cls_contract: ContractType
 
+    # The log-output relies on per-instance 'compression', so is an instance descriptor
+    log = InstanceDescriptorProxy("log")
+
+    # The names of the parameters declared on the class (see __init_subclass__)
+    _PARAMETER_NAMES: Tuple[str, ...] = ()
+
+    # The minimum number of seconds between progress updates to the server, unless the
+    # progress changes by at least _PROGRESS_UPDATE_STEP (or completes)
+    _PROGRESS_UPDATE_INTERVAL: float = 1.0
+    _PROGRESS_UPDATE_STEP: float = 0.05
+
+    # How much the interval between cancellation checks grows after each check which finds
+    # the job still running, and the most it can grow to (in seconds)
+    _CANCEL_CHECK_BACKOFF: float = 1.5
+    _CANCEL_CHECK_MAX_WAIT: float = 60.0
+
+    # The number of files above which _any_present checks the files in parallel
+    _ANY_PRESENT_SERIAL_LIMIT: int = 32
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Put the descriptors declared on the class behind proxies, so that instances can
+        # replace them with their own (see InstanceDescriptorProxy)
+        for attr_name, attr in list(vars(cls).items()):
+            if isinstance(attr, (Parameter, ExtraOutput)):
+                setattr(cls, attr_name, InstanceDescriptorProxy(attr_name, attr))
+
+        # Walk the MRO (base-most first) so that sub-classes override the
+        # attributes of any of their bases
+        parameter_names: Dict[str, bool] = {}
+        for klass in reversed(cls.__mro__):
+            for attr_name, attr in vars(klass).items():
+                parameter_names[attr_name] = (
+                    isinstance(attr, InstanceDescriptorProxy)
+                    and isinstance(attr.fallback, Parameter)
+                )
+        cls._PARAMETER_NAMES = tuple(
+            attr_name
+            for attr_name, is_parameter in parameter_names.items()
+            if is_parameter
+        )
+
     @classmethod
     def cls_contract(cls) -> UFDLJobContract:
         return cls._cls_contract
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _log_output(compression: int) -> ExtraOutput:
+        """
+        Gets the log-output descriptor for the given compression. The descriptor
+        holds no per-instance state, so one is shared per compression level.
+
+        :param compression: the compression (see zipfile, ZIP_STORED/0 = no compression)
+        :return: the log-output descriptor
+        """
+        log = ExtraOutput(Compressed(JSON(), compression))
+        log.__set_name__(AbstractJobExecutor, "log")
+        return log
+
     def __init__(
             self,
             context: UFDLServerContext,
@@ -68,27 +175,45 @@ class AbstractJobExecutor(Generic[ContractType]):
         self._keep_job_dirs = config.general.keep_job_dirs
         self._context = context
         self._work_dir = config.docker.work_dir
+        self._str: Optional[str] = None
         self._cache_dir = config.docker.cache_dir
         self._job_dir = None
         self._use_sudo = config.docker.use_sudo
         self._ask_sudo_pw = config.docker.ask_sudo_pw
         self._log: List[Dict[str, RawJSONObject]] = []
+        self._log_written = 0
+        self._log_file: Optional[BinaryIO] = None
+        # Background tasks (e.g. docker image pulls) log too, so the log and its file are locked
+        self._log_lock = threading.RLock()
         self._compression = config.general.compression
+        self._compresslevel = config.general.compresslevel
+        self._max_log_output = config.general.max_log_output
         self._notification_type = None
         self._template = template
         self._job = job
-        self._last_cancel_check = None
+        self._job_pk = int(job['pk'])
+        self._last_cancel_check: Optional[float] = None
         self._cancel_check_wait = config.general.cancel_check_wait
-        self._job_is_cancelled = False
-        self._input_value_cache = {}
+        self._cancel_check_interval = self._cancel_check_wait
+        # Background tasks (e.g. docker image pulls) check for cancellation too, so only
+        # one thread checks with the backend at a time
+        self._cancel_check_lock = threading.RLock()
+        self._cancel_event = threading.Event()
+        self._job_finished = False
+        self._input_value_cache: Dict[str, Any] = {}
+        self._parameter_value_cache: Dict[str, Any] = {}
+        self._last_progress_sent_at = 0.0
+        self._last_progress_value = -1.0
+        self._pending_progress: Optional[Tuple[float, Dict[str, RawJSONElement]]] = None
 
         self._initialise_contracts_and_types()
 
-        # Create an instance descriptor for the log-output as it relies on per-instance 'compression'
-        self.log = ExtraOutput(Compressed(JSON(), self._compression))
+        # Install the instance descriptor for the log-output directly, as the shared
+        # descriptor is already bound
+        self.__dict__['log'] = self._log_output(self._compression)
 
         # Parse the contract-type declared in the template
-        contract = parse_contract(template["type"])
+        contract = cached_parse_contract(template["type"])
         cls_contract = self.cls_contract()
         if not contract.is_subtype_of(cls_contract):
             raise Exception(f"Declared contract-type ${contract} is not usable as ${cls_contract}")
@@ -131,6 +256,24 @@ class AbstractJobExecutor(Generic[ContractType]):
         """
         self._compression = value
 
+    @property
+    def compresslevel(self) -> int:
+        """
+        Returns the compression level in use.
+
+        :return: the level (see zipfile, 1-9 for ZIP_DEFLATED/ZIP_BZIP2, ignored otherwise)
+        """
+        return self._compresslevel
+
+    @compresslevel.setter
+    def compresslevel(self, value: int):
+        """
+        Sets the compression level to use.
+
+        :param value: the level (see zipfile, 1-9 for ZIP_DEFLATED/ZIP_BZIP2, ignored otherwise)
+        """
+        self._compresslevel = value
+
     @property
     def context(self) -> UFDLServerContext:
         """
@@ -212,7 +355,7 @@ class AbstractJobExecutor(Generic[ContractType]):
 
     @property
     def job_pk(self) -> int:
-        return int(self._job['pk'])
+        return self._job_pk
 
     @property
     def template(self) -> Template:
@@ -223,36 +366,37 @@ class AbstractJobExecutor(Generic[ContractType]):
         """
         return self._template
 
-    def __getattribute__(self, item: str) -> Any:
-        # Hack to make instance descriptors work like class descriptors
-        attribute = super().__getattribute__(item)
-        if isinstance(attribute, Parameter):
-            return attribute.__get__(self, type(self))
-        return attribute
-
     def __setattr__(self, key: str, value: Any) -> None:
-        # Hack to make instance descriptors work like class descriptors
-        try:
-            attribute = super().__getattribute__(key)
-            if isinstance(attribute, ExtraOutput):
-                return attribute.__set__(self, value)
-        except AttributeError:
-            pass
-
-        # Need to call __set_name__ manually
-        if isinstance(value, (Parameter, ExtraOutput)):
-            value.__set_name__(type(self), key)
+        # Descriptors assigned to an instance are accessed via a proxy descriptor on
+        # the class. If the class doesn't declare one for the name, the instance is moved
+        # to a private sub-class which does, so the executor's own class is unaffected
+        if isinstance(value, (Parameter, ExtraOutput)) and not self._has_instance_descriptor_proxy(key):
+            object.__setattr__(self, '__class__', _instance_descriptor_subclass(type(self), key))
 
         return super().__setattr__(key, value)
 
+    @classmethod
+    def _has_instance_descriptor_proxy(cls, name: str) -> bool:
+        """
+        Whether the class has a proxy for instance descriptors under the given name.
+
+        :param name: the attribute name
+        :return: True if the (inherited) class attribute is an InstanceDescriptorProxy
+        """
+        for klass in cls.__mro__:
+            if name in vars(klass):
+                return isinstance(vars(klass)[name], InstanceDescriptorProxy)
+        return False
+
     def __getitem__(self, item: Input[InputType]) -> InputType:
         # Make sure we own the input
         our_input = self.contract.inputs.get(item.name, None)
         if item is not our_input:
             raise Exception(f"Unowned input '{item.name}'")
 
-        if item in self._input_value_cache:
-            return self._input_value_cache[item]
+        # The job's input values don't change, so only parse each once
+        if item.name in self._input_value_cache:
+            return self._input_value_cache[item.name]
 
         # Get the JSON value and type from the job description
         input_value_and_type = self.job['input_values'][item.name]
@@ -260,13 +404,13 @@ class AbstractJobExecutor(Generic[ContractType]):
         input_type_string = input_value_and_type['type']
 
         # Parse the type
-        input_type = parse_type(input_type_string)
+        input_type = cached_parse_type(input_type_string)
         assert isinstance(input_type, UFDLJSONType)
 
         # Use the type to parse the value
         parsed_value = input_type.parse_json_value(input_value_json)
 
-        self._input_value_cache[item] = parsed_value
+        self._input_value_cache[item.name] = parsed_value
 
         return parsed_value
 
@@ -291,29 +435,32 @@ class AbstractJobExecutor(Generic[ContractType]):
             from ufdl.pythonclient.functional.core._mixin_actions import download
             return download(self.context, f"v1/{table_name}", pk)
 
-        initialise_types(
-            list_function,
-            download_function,
-            {
-                job_type['name']: load_class(
-                    job_type['cls'],
+        host = self.context.host
+        if host not in _KNOWN_TYPES_AND_CONTRACTS:
+            # The classes themselves are only loaded when first referenced
+            _KNOWN_TYPES_AND_CONTRACTS[host] = (
+                LazyClassMapping(
+                    {
+                        job_type['name']: (job_type['cls'], job_type['pkg'])
+                        for job_type in list_function('job-types', FilterSpec())
+                    },
                     UFDLType,
-                    required_packages=[job_type['pkg']],
+                    debug=True
+                ),
+                LazyClassMapping(
+                    {
+                        job_contract['name']: (job_contract['cls'], job_contract['pkg'])
+                        for job_contract in list_function('job-contracts', FilterSpec())
+                    },
+                    UFDLJobContract,
                     debug=True
                 )
-                for job_type in list_function('job-types', FilterSpec())
-            }
-        )
-
-        initialise_contracts({
-            job_contract['name']: load_class(
-                job_contract['cls'],
-                UFDLJobContract,
-                required_packages=[job_contract['pkg']],
-                debug=True
             )
-            for job_contract in list_function('job-contracts', FilterSpec())
-        })
+        known_types, known_contracts = _KNOWN_TYPES_AND_CONTRACTS[host]
+
+        initialise_types(list_function, download_function, known_types)
+
+        initialise_contracts(known_contracts)
 
     def _parameters(self) -> Iterator[Tuple[str, bool]]:
         """
@@ -323,13 +470,16 @@ class AbstractJobExecutor(Generic[ContractType]):
         :return:
                     Iterator of (parameter name, template-defined) pairs.
         """
-        for attr_name in dir(self):
-            # Need to use super __getattribute__ method to return parameter descriptors,
-            # not values
-            attr_value = super().__getattribute__(attr_name)
-            if isinstance(attr_value, Parameter):
-                is_defined_on_template = attr_name in self._template['parameters']
-                yield attr_name, is_defined_on_template
+        template_parameters = self._template['parameters']
+
+        # Parameters declared on the class
+        for attr_name in self._PARAMETER_NAMES:
+            yield attr_name, attr_name in template_parameters
+
+        # Parameters assigned to this instance (which may replace a class parameter)
+        for attr_name, attr_value in self.__dict__.items():
+            if isinstance(attr_value, Parameter) and attr_name not in self._PARAMETER_NAMES:
+                yield attr_name, attr_name in template_parameters
 
     def _add_output_to_job(self, name: str, type: UFDLType[tuple, Any, OutputType], value: OutputType):
         job_add_output(
@@ -346,11 +496,37 @@ class AbstractJobExecutor(Generic[ContractType]):
 
         :param data: the object to add
         """
-        self._log.append(
-            {
-                str(datetime.now()): data
-            }
-        )
+        with self._log_lock:
+            self._log.append(
+                {
+                    str(datetime.now()): data
+                }
+            )
+
+    @classmethod
+    def _scrubber(cls, hide: Optional[List[str]]) -> Optional[Pattern]:
+        """
+        Gets a regular expression which fully matches any of the strings to hide.
+
+        :param hide: the list of strings to hide
+        :return: the regular expression, or None if there is nothing to hide
+        """
+        if not hide:
+            return None
+
+        return cls._compile_scrubber(tuple(hide))
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _compile_scrubber(hide: Tuple[str, ...]) -> Pattern:
+        """
+        Compiles the regular expression for _scrubber. Cached, as the same
+        strings are typically hidden across many calls.
+
+        :param hide: the strings to hide
+        :return: the regular expression
+        """
+        return re.compile("|".join(map(re.escape, sorted(set(hide)))))
 
     def _obscure(
             self,
@@ -358,18 +534,18 @@ class AbstractJobExecutor(Generic[ContractType]):
             hide: Optional[List[str]]
     ) -> List[str]:
         """
-        Obscures/masks the specified list of strings in the
+        Obscures/masks the arguments which are one of the specified list of strings.
 
         :param args: the list of string arguments to process
         :param hide: the list of strings to hide
         :return: the obscured list of strings
         """
-        if (hide is None) or (len(hide) == 0):
+        scrubber = self._scrubber(hide)
+        if scrubber is None:
             return args
 
-        to_hide = set(hide)
         return [
-            "***" if arg in to_hide else arg
+            "***" if scrubber.fullmatch(arg) else arg
             for arg in args
         ]
 
@@ -379,20 +555,51 @@ class AbstractJobExecutor(Generic[ContractType]):
 
         :param args: the arguments to log, get turned into a string, blank separated (similar to print)
         """
-        str_args = [str(x) for x in args]
-        data = dict()
-        data['msg'] = " ".join(str_args).split("\n")
-        self._add_log(data)
+        msg = " ".join(map(str, args))
+        self._log_lines(msg.split("\n"), msg)
+
+    def _log_lines(self, lines: List[str], msg: Optional[str] = None) -> None:
+        """
+        Logs a message which has already been split into lines.
+
+        :param lines: the lines of the message
+        :param msg: the message as a single string, if already available (only used in debugging mode)
+        """
+        with self._log_lock:
+            self._add_log({'msg': lines})
+            # write to disk
+            if self._log_file is not None:
+                self._write_log()
         if self.debug:
-            logger().debug("\n".join(data['msg']))
-        # write to disk
-        if self.job_dir is not None:
-            log = self.job_dir + "/log.json"
+            logger().debug(msg if msg is not None else "\n".join(lines))
+
+    def _write_log(self) -> None:
+        """
+        Writes any log entries not yet on disk to the log file in the job directory.
+        The file is kept as a valid JSON array, but only the new entries are written,
+        rather than re-serialising the entire log each time.
+        """
+        with self._log_lock:
+            log_file = self._log_file
+            written = len(self._log)
+            # Nothing to do if the log is closed, or another thread already wrote the new entries
+            if log_file is None or written == self._log_written:
+                return
+            new_entries = ",\n".join(
+                json.dumps(entry, separators=(",", ":"), default=str)
+                for entry in self._log[self._log_written:written]
+            ).encode()
             try:
-                with open(log, "w") as log_file:
-                    json.dump(self._log, log_file, indent=2)
+                if self._log_written == 0:
+                    log_file.write(b"[\n" + new_entries + b"\n]")
+                else:
+                    # Overwrite the closing "\n]" with the new entries
+                    log_file.seek(-2, os.SEEK_END)
+                    log_file.write(b",\n" + new_entries + b"\n]")
+                log_file.flush()
+                self._log_written = written
             except:
-                logger().error("Failed to write log data to: %s" % log)
+                logger().error("Failed to write log data to: %s" % log_file.name)
                 logger().error(traceback.format_exc())
 
     def log_file(self, msg: str, filename: str) -> None:
@@ -404,14 +611,12 @@ class AbstractJobExecutor(Generic[ContractType]):
         """
         try:
             with open(filename, "r") as lf:
-                lines = lf.readlines()
-
-            joined_lines = "".join(lines)
+                content = lf.read()
 
-            self.log_msg(
-                f"{msg}\n"
-                f"{joined_lines}"
-            )
+            # Split the content directly, rather than joining it to the message and re-splitting
+            lines = msg.split("\n")
+            lines.extend(content.split("\n"))
+            self._log_lines(lines)
         except:
             self.log_msg(
                 f"Failed to read file: {filename}\n"
@@ -444,45 +649,118 @@ class AbstractJobExecutor(Generic[ContractType]):
         self.log_msg("rmdir:", directory)
         shutil.rmtree(directory, ignore_errors=True)
 
-    def _to_logentry(self, completed: CompletedProcess, hide: List[str]) -> RawJSONObject:
+    def _rmdir_in_background(self, directory: str):
+        """
+        Removes the directory recursively in a background thread.
+
+        :param directory: the directory to delete
+        """
+        self.log_msg("rmdir (background):", directory)
+        _CLEANUP_POOL.submit(shutil.rmtree, directory, ignore_errors=True)
+
+    def _to_logentry(
+            self,
+            completed: CompletedProcess,
+            hide: List[str],
+            obscured_cmd: Optional[List[str]] = None
+    ) -> RawJSONObject:
         """
         Turns the CompletedProcess object into a log entry.
 
         :param completed: the CompletedProcess object to convert
         :param hide: the list of strings to obscure in the log message
+        :param obscured_cmd: the command with the strings already obscured, if available
         :return: the log entry
         """
         result: RawJSONObject = dict()
-        result['cmd'] = self._obscure(completed.args, hide)
-        if completed.stdout is not None:
-            if isinstance(completed.stdout, str):
-                result['stdout'] = completed.stdout.split("\n")
-            elif isinstance(completed.stdout, list):
-                result['stdout'] = completed.stdout[:]
-            else:
-                result['stdout'] = completed.stdout.decode().split("\n")
-        if completed.stderr is not None:
-            if isinstance(completed.stderr, str):
-                result['stderr'] = completed.stderr.split("\n")
-            elif isinstance(completed.stderr, list):
-                result['stderr'] = completed.stderr[:]
-            else:
-                result['stderr'] = completed.stderr.decode().split("\n")
+        result['cmd'] = obscured_cmd if obscured_cmd is not None else self._obscure(completed.args, hide)
+        limit = self._max_log_output
+        for output, value in (('stdout', completed.stdout), ('stderr', completed.stderr)):
+            if value is None:
+                continue
+
+            # Only the end of overly long output is kept (where any errors are likely to be),
+            # cutting it before it is decoded/split into lines
+            truncated = 0
+            unit = "bytes" if isinstance(value, bytes) else "characters"
+            if isinstance(value, (bytes, str)):
+                if 0 < limit < len(value):
+                    truncated = len(value) - limit
+                    value = value[-limit:]
+                if isinstance(value, bytes):
+                    value = value.decode(errors="replace" if truncated > 0 else "strict")
+                value = value.splitlines()
+            elif limit > 0:
+                # N.B. lists (from reading the output line-by-line) are otherwise used as-is, not copied
+                value, truncated = self._tail_lines(value, limit)
+
+            if truncated > 0:
+                value = [f"...[truncated {truncated} {unit}]"] + value
+
+            result[output] = value
         result['returncode'] = completed.returncode
         return result
 
+    @staticmethod
+    def _tail_lines(lines: List[str], limit: int) -> Tuple[List[str], int]:
+        """
+        Gets the lines at the end of the list with at most the given total length.
+        Of the last line which doesn't fit whole (e.g. a single huge line), the end is kept.
+
+        :param lines: the lines to get the tail of
+        :param limit: the maximum total length of the lines to keep
+        :return: the kept lines (the list itself if all are kept), and the total length of the dropped text
+        """
+        kept = 0
+        start = len(lines)
+        while start > 0 and kept + len(lines[start - 1]) <= limit:
+            start -= 1
+            kept += len(lines[start])
+
+        if start == 0:
+            return lines, 0
+
+        tail = lines[start:]
+        dropped = sum(map(len, lines[:start]))
+        remaining = limit - kept
+        if remaining > 0:
+            tail.insert(0, lines[start - 1][-remaining:])
+            dropped -= remaining
+
+        return tail, dropped
+
     def _ping_backend(self) -> None:
         """
-        Ensuring that the connection is still live.
+        Ensuring that the connection is still live. Uses an immediate cancellation
+        check for this, so the same round-trip also refreshes the cancellation state.
         """
         try:
-            node_ping(self.context)
-        except:
+            self.is_job_cancelled(immediate=True)
+        except Exception:
             self.log_msg(
                 f"Failed to ping backend:\n"
                 f"{traceback.format_exc()}"
             )
 
+    def _recent_cancel_check(self) -> bool:
+        """
+        Whether a cancellation check reached the backend within the last self._cancel_check_wait
+        seconds, in which case pinging the backend can be skipped (the cancellation state is
+        then at most that stale). If so, resets the interval between cancellation checks, so
+        that the next stage still starts with frequent checks.
+
+        :return: True if there was a recent cancellation check
+        """
+        with self._cancel_check_lock:
+            if (
+                    self._last_cancel_check is None
+                    or time.monotonic() - self._last_cancel_check >= self._cancel_check_wait
+            ):
+                return False
+
+            self._cancel_check_interval = self._cancel_check_wait
+            return True
+
     def _execute_can_use_stdin(self, no_sudo: bool = False) -> bool:
         """
         Returns whether the _execute function can use stdin.
@@ -492,6 +770,57 @@ class AbstractJobExecutor(Generic[ContractType]):
         """
         return not (self.use_sudo and not no_sudo and self.ask_sudo_pw)
 
+    def _command_stopped(self, stop: Optional[threading.Event] = None) -> bool:
+        """
+        Whether a command being executed should be stopped.
+
+        :param stop: the event which stops the command once set, if any
+        :return: True if the stop event is set, or the job was cancelled
+        """
+        return (stop is not None and stop.is_set()) or self.is_job_cancelled()
+
+    def _iter_output_lines(self, process: subprocess.Popen, stop: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Iterates over the lines of a process's (binary) stdout as they become available.
+        Output is read in chunks rather than line-by-line, and waiting for output times out
+        so that cancellation is noticed even if the process goes quiet. If the job is
+        cancelled (or the stop event is set), the process is terminated and iteration stops.
+
+        Lines are decoded like text-mode pipes do, with universal newlines (so the
+        carriage-returns used by progress bars also end lines), and undecodable bytes
+        are replaced rather than failing the command.
+
+        :param process: the process to read the output of
+        :param stop: the event which stops the process once set, if any
+        :return: an iterator over the lines, including their line-endings
+        """
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True)
+        fd = process.stdout.fileno()
+        timeout = max(self._cancel_check_wait, 1)
+        partial_line = ""
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while True:
+                # terminate job if canceled
+                if self._command_stopped(stop):
+                    process.terminate()
+                    return
+
+                if not selector.select(timeout):
+                    continue
+
+                data = os.read(fd, 65536)
+                lines = (partial_line + decoder.decode(data, final=not data)).split("\n")
+                partial_line = lines.pop()
+                for line in lines:
+                    yield line + "\n"
+
+                # End of output
+                if not data:
+                    if partial_line != "":
+                        yield partial_line
+                    return
+
     def _execute(
             self,
             cmd: List[str],
@@ -500,7 +829,8 @@ class AbstractJobExecutor(Generic[ContractType]):
             capture_output: bool = True,
             stdin: Optional[str] = None,
             hide: Optional[List[str]] = None,
-            command_progress_parser: Optional[CommandProgressParser] = None
+            command_progress_parser: Optional[CommandProgressParser] = None,
+            stop: Optional[threading.Event] = None
     ) -> Optional[CompletedProcess]:  # CompletedProcess[Union[bytes, str, List[str], None]]
         """
         Executes the command.
@@ -515,6 +845,8 @@ class AbstractJobExecutor(Generic[ContractType]):
         :param stdin: the text to feed into the process via stdin
         :param hide: the list of strings to obscure in the log message
         :param command_progress_parser: the parser for the command output for updating the progress in the backend
+        :param stop: an event which terminates the command once set, in addition to the job being
+                     cancelled (e.g. to stop a command run in the background which is no longer required)
         :return: the CompletedProcess object from executing the command, uses 255 as return code in case of an
                  exception and stores the stack trace in stderr
         """
@@ -528,42 +860,65 @@ class AbstractJobExecutor(Generic[ContractType]):
                 full.append("-S")
         full.extend(cmd)
 
-        self.log_msg("Executing:", " ".join(self._obscure(full, hide)))
+        obscured = self._obscure(full, hide)
+        self.log_msg("Executing:", " ".join(obscured))
 
+        # N.B. close_fds=False avoids scanning/closing every open descriptor in the
+        # child; our own descriptors are non-inheritable by default (PEP 446)
         try:
             if stdin is not None:
                 if not stdin.endswith("\n"):
                     stdin = stdin + "\n"
-                process = subprocess.Popen(full, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                process = subprocess.Popen(full, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=False)
                 stdout, stderr = process.communicate(input=stdin.encode())
                 result = CompletedProcess(full, process.returncode, stdout=stdout, stderr=stderr)  # CompletedProcess[bytes]
             else:
                 stdout_list = []
-                process = subprocess.Popen(full, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
-                last_progress = 0.0
-                while True:
-                    # terminate job if canceled
-                    if self.is_job_cancelled():
-                        process.terminate()
-                        break
-                    line = process.stdout.readline()
-                    if not line:
-                        break
-                    if capture_output:
-                        stdout_list.append(line)
-                    if capture_output and (command_progress_parser is not None):
+                if not capture_output:
+                    # Nothing reads the output, so discard it rather than reading it line-by-line,
+                    # and just wake periodically to check for cancellation
+                    process = subprocess.Popen(full, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, close_fds=False)
+                    while True:
                         try:
-                            progress, progress_metadata = command_progress_parser.parse(line, last_progress)
-                        except:
-                            command_progress_parser = None
-                            self.log_msg("Failed to parse progress output, disabling!", traceback.format_exc())
-                        else:
-                            if progress != last_progress or progress_metadata is not None:
-                                if progress_metadata is None:
-                                    progress_metadata = {}
-                                self.progress(progress, **progress_metadata)
-                            last_progress = progress
-                if self.is_job_cancelled():
+                            process.wait(timeout=max(self._cancel_check_wait, 1))
+                            break
+                        except subprocess.TimeoutExpired:
+                            # terminate job if canceled
+                            if self._command_stopped(stop):
+                                process.terminate()
+                                break
+                else:
+                    process = subprocess.Popen(full, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0, close_fds=False)
+
+                    # Bind the per-line calls locally, as this loop runs for every line of output
+                    append_line = stdout_list.append
+                    parse = (
+                        command_progress_parser.parse
+                        if command_progress_parser is not None and not command_progress_parser.noop
+                        else None
+                    )
+                    last_progress = 0.0
+                    for line in self._iter_output_lines(process, stop):
+                        append_line(line)
+                        if parse is not None:
+                            try:
+                                progress, progress_metadata = parse(line, last_progress)
+                            except:
+                                parse = None
+                                self.log_msg("Failed to parse progress output, disabling!", traceback.format_exc())
+                            else:
+                                if progress != last_progress or progress_metadata is not None:
+                                    if progress_metadata is None:
+                                        progress_metadata = {}
+                                    self.progress(progress, **progress_metadata)
+                                last_progress = progress
+                    # Send the final state of the progress, if it was held back
+                    if command_progress_parser is not None:
+                        self._flush_progress()
+                if stop is not None and stop.is_set():
+                    stdout_list.append("Command was stopped")
+                    result = CompletedProcess(full, 255, stdout=stdout_list, stderr=None)  # CompletedProcess[Optional[List[str]]]
+                elif self.is_job_cancelled():
                     stdout_list.append("Job was cancelled")
                     result = CompletedProcess(full, 255, stdout=stdout_list, stderr=None)  # CompletedProcess[Optional[List[str]]]
                 else:
@@ -572,7 +927,7 @@ class AbstractJobExecutor(Generic[ContractType]):
         except:
             result = CompletedProcess(full, 255, stdout=None, stderr=traceback.format_exc())  # CompletedProcess[Optional[str]]
 
-        self._add_log(self._to_logentry(result, hide))
+        self._add_log(self._to_logentry(result, hide, obscured))
 
         if always_return or (result.returncode > 0):
             return result
@@ -628,17 +983,24 @@ class AbstractJobExecutor(Generic[ContractType]):
         self.log_msg("Compressing:", files, "->", zipfile)
 
         try:
-            with ZipFile(zipfile, "w", compression=self._compression) as zf:
+            # Decide how to strip the path once, rather than per file
+            strip_all = isinstance(strip_path, bool)
+            strip_prefix = strip_path if strip_path is not None and not strip_all else None
+
+            with ZipFile(zipfile, "w", compression=self._compression, compresslevel=self._compresslevel, **_ZIP_TIMESTAMP_OPTIONS) as zf:
+                write = zf.write
                 for f in files:
                     arcname = None
-                    if strip_path is not None:
-                        if isinstance(strip_path, bool):
-                            arcname = os.path.basename(f)
-                        elif f.startswith(strip_path):
-                            arcname = f[len(strip_path):]
-                        if arcname.startswith("/"):
-                            arcname = arcname[1:]
-                    zf.write(f, arcname=arcname)
+                    if strip_all:
+                        arcname = os.path.basename(f)
+                    elif strip_prefix is not None and f.startswith(strip_prefix):
+                        arcname = f[len(strip_prefix):].lstrip("/")
+                    # Store already-compressed files as-is, rather than spending the
+                    # time deflating them again for no gain
+                    if os.path.splitext(f)[1].lower() in ALREADY_COMPRESSED_EXTENSIONS:
+                        write(f, arcname=arcname, compress_type=ZIP_STORED)
+                    else:
+                        write(f, arcname=arcname)
             return None
         except:
             msg = (
@@ -674,18 +1036,29 @@ class AbstractJobExecutor(Generic[ContractType]):
         :param files: the file names to check (absolute paths)
         :return: True if at least one present
         """
-        result = False
-
-        for f in files:
-            if os.path.exists(f) and os.path.isfile(f):
-                result = True
-                break
+        # N.B. os.path.isfile implies existence, so only one stat call is needed per file
+        if len(files) <= self._ANY_PRESENT_SERIAL_LIMIT:
+            return any(os.path.isfile(f) for f in files)
 
-        return result
+        # For long lists, overlap the stat calls (mostly waiting on I/O on network file-systems)
+        pool = ThreadPoolExecutor(max_workers=min(16, len(files)), thread_name_prefix="ufdl-stat")
+        try:
+            futures = [pool.submit(os.path.isfile, f) for f in files]
+            for future in as_completed(futures):
+                if future.result():
+                    for other in futures:
+                        other.cancel()
+                    return True
+            return False
+        finally:
+            pool.shutdown(wait=False)
 
     def progress(self, progress: float, **data: RawJSONElement):
         """
-        Updates the server on the progress of the job.
+        Updates the server on the progress of the job. Updates are coalesced, as each is
+        a request to the server: an update which is too soon after the last one (see
+        _PROGRESS_UPDATE_INTERVAL/_PROGRESS_UPDATE_STEP) is held back, to be replaced by
+        the next update or sent by _flush_progress.
 
         :param progress: the progress amount in [0.0, 1.0]
         :param data: other JSON meta-data about the progress
@@ -695,6 +1068,36 @@ class AbstractJobExecutor(Generic[ContractType]):
         if self.is_job_cancelled():
             return
 
+        if (
+            progress < 1.0
+            and time.monotonic() - self._last_progress_sent_at < self._PROGRESS_UPDATE_INTERVAL
+            and abs(progress - self._last_progress_value) < self._PROGRESS_UPDATE_STEP
+        ):
+            self._pending_progress = (progress, data)
+            return
+
+        self._send_progress(progress, data)
+
+    def _flush_progress(self) -> None:
+        """
+        Sends any progress update which was held back by progress.
+        """
+        if self._pending_progress is None or self.is_job_cancelled():
+            return
+
+        self._send_progress(*self._pending_progress)
+
+    def _send_progress(self, progress: float, data: Dict[str, RawJSONElement]) -> None:
+        """
+        Sends a progress update to the server.
+
+        :param progress: the progress amount in [0.0, 1.0]
+        :param data: other JSON meta-data about the progress
+        """
+        self._pending_progress = None
+        self._last_progress_sent_at = time.monotonic()
+        self._last_progress_value = progress
+
         try:
             progress_job(self.context, self.job_pk, progress, **data)
         except:
@@ -719,6 +1122,11 @@ class AbstractJobExecutor(Generic[ContractType]):
 
         :param localfile: the file to upload
         """
+        # Results of a cancelled job are discarded, so don't spend time uploading them
+        if self._cancel_event.is_set():
+            self.log_msg("Job was cancelled, not uploading file:", localfile)
+            return
+
         if file_type is None:
             file_type = output.type
 
@@ -745,6 +1153,11 @@ class AbstractJobExecutor(Generic[ContractType]):
         :param strip_path: whether to strip the path from the files (None, True or path-prefix to remove)
         :type strip_path: bool or str
         """
+        # Results of a cancelled job are discarded, so don't spend time compressing them
+        if self._cancel_event.is_set():
+            self.log_msg("Job was cancelled, not generating zip file %s" % zipfile)
+            return
+
         if len(files) == 0:
             self.log_msg("No files supplied, cannot generate zip file %s:" % zipfile)
             return
@@ -781,6 +1194,9 @@ class AbstractJobExecutor(Generic[ContractType]):
 
         # jobdir
         self._job_dir = self._mktmpdir()
+        self._log_written = 0
+        # Keep the log file open for the duration of the job, rather than re-opening it per message
+        self._log_file = open(os.path.join(self._job_dir, "log.json"), "wb+")
         self.log_msg(f"Created jobdir: {self._job_dir}")
 
         # acquire
@@ -821,10 +1237,21 @@ class AbstractJobExecutor(Generic[ContractType]):
 
     def _do_run(self) -> None:
         """
-        Executes the actual job. Only gets run if pre-run was successful.
+        Executes the actual job. Only gets run if pre-run was successful and the
+        job wasn't cancelled in the meantime. Long-running implementations should
+        check is_job_cancelled (or wait on cancel_event) at natural boundaries, such
+        as the end of each epoch.
         """
         raise NotImplementedError(self._do_run.__qualname__)
 
+    def _complete_pre_run(self) -> None:
+        """
+        Hook method called after a successful pre-run, to wait for any work it started
+        in the background. Raises an exception if that work failed, which fails the
+        pre-run (so the actual job isn't run).
+        """
+        pass
+
     def _post_run(
             self,
             pre_run_success: bool,
@@ -833,12 +1260,18 @@ class AbstractJobExecutor(Generic[ContractType]):
     ) -> None:
         """
         Hook method after the actual job has been run. Will always be executed.
+        If the job was cancelled (see cancel_event, which is refreshed just before
+        this is called), file outputs are not uploaded and other expensive result
+        processing should be skipped too.
 
         :param pre_run_success: whether the pre_run code was successfully run
         :param do_run_success: whether the do_run code was successfully run (only gets run if pre-run was successful)
         :param error: any error that may have occurred, None if none occurred
         """
 
+        # send any progress which was held back
+        self._flush_progress()
+
         # zip+upload log
         self.log = self._log
 
@@ -851,14 +1284,29 @@ class AbstractJobExecutor(Generic[ContractType]):
                 elif not do_run_success:
                     error = "An error occurred during run, check log!"
             finish_job(self.context, self.job_pk, pre_run_success and do_run_success, self.notification_type, error=error)
-        except HTTPError as e:
-            self.log_msg("Failed to finish job %d!\n%s\n%s" % (self.job_pk, str(e.response.text), traceback.format_exc()))
-        except:
-            self.log_msg("Failed to finish job %d!\n%s" % (self.job_pk, traceback.format_exc()))
+            self._job_finished = True
+        except ConnectionError as e:
+            self.log_msg("Failed to finish job %d, backend unreachable: %s" % (self.job_pk, str(e)))
+        except Exception as e:
+            # Include the server's response for HTTP errors
+            details = [str(e.response.text)] if isinstance(e, HTTPError) else []
+            details.append(traceback.format_exc())
+            self.log_msg("Failed to finish job %d!\n%s" % (self.job_pk, "\n".join(details)))
+
+    def _cleanup(self) -> None:
+        """
+        Cleans up after the job, once it has been finalised with the backend.
+        Always executed, even if the post-run fails.
+        """
+        # close the log file
+        with self._log_lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
 
         # clean up job dir?
-        if not self._keep_job_dirs:
-            self._rmdir(self.job_dir)
+        if self._job_dir is not None and not self._keep_job_dirs:
+            self._rmdir_in_background(self._job_dir)
         self._job_dir = None
 
     def can_run(self, hardware_info: HardwareInfo):
@@ -871,59 +1319,114 @@ class AbstractJobExecutor(Generic[ContractType]):
         """
         return None
 
+    @property
+    def cancel_event(self) -> threading.Event:
+        """
+        Gets the event which is set once the job is known to be cancelled. Can be
+        waited on (e.g. instead of sleeping) to wake as soon as cancellation is detected.
+
+        :return: the cancellation event
+        """
+        return self._cancel_event
+
     def is_job_cancelled(self, immediate: bool = False) -> bool:
         """
-        Checks if this job has been cancelled. Queries the backend if the _job_is_cancelled flag is not set,
-        (at-most every self._cancel_check_wait seconds).
+        Checks if this job has been cancelled. Queries the backend if the cancel event is not set,
+        (at-most every self._cancel_check_interval seconds). The interval starts at
+        self._cancel_check_wait, and backs off each time the job is found not to be cancelled.
 
         :param immediate: whether to ignore the check throttling and check immediately
+                          (also resets the interval, e.g. before starting an expensive stage)
         :return: Whether the job has been cancelled
         """
-        if self._job_is_cancelled:
+        if self._cancel_event.is_set():
             return True
 
-        now = datetime.now()
+        with self._cancel_check_lock:
+            now = time.monotonic()
 
-        if not (
-            immediate
-            or (self._last_cancel_check is None)
-            or ((now - self._last_cancel_check).total_seconds() >= self._cancel_check_wait)
-        ):
-            return False
+            if immediate:
+                self._cancel_check_interval = self._cancel_check_wait
+            elif not (
+                (self._last_cancel_check is None)
+                or (now - self._last_cancel_check >= self._cancel_check_interval)
+            ):
+                return False
 
-        updated_job = job_retrieve(self.context, self.job_pk)
-        self._job_is_cancelled = updated_job['is_cancelled']
-        self._last_cancel_check = now
+            updated_job = job_retrieve(self.context, self.job_pk)
+            if updated_job['is_cancelled']:
+                self._cancel_event.set()
+            else:
+                self._cancel_check_interval = min(
+                    self._cancel_check_interval * self._CANCEL_CHECK_BACKOFF,
+                    max(self._CANCEL_CHECK_MAX_WAIT, self._cancel_check_wait)
+                )
+            self._last_cancel_check = now
+
+        return self._cancel_event.is_set()
+
+    def _abort(self, error: str) -> None:
+        """
+        Finishes the job as failed with the backend when the run is interrupted
+        (e.g. KeyboardInterrupt/SystemExit) before it was finished, so that it isn't
+        left acquired by this node. Skips all other post-run processing.
 
-        return self._job_is_cancelled
+        :param error: the reason the job failed
+        """
+        self.log_msg(error)
+        try:
+            finish_job(self.context, self.job_pk, False, self.notification_type, error=error)
+            self._job_finished = True
+        except Exception:
+            self.log_msg("Failed to finish interrupted job %d!\n%s" % (self.job_pk, traceback.format_exc()))
 
     def run(self) -> None:
         """
         Applies the template and executes the job. Raises an exception if it fails.
         """
         error = None
+        pre_run_success = False
         do_run_success = False
         try:
-            pre_run_success = self._pre_run()
-        except:
-            pre_run_success = False
-            error = "Failed to execute pre-run code:\n%s" % traceback.format_exc()
-            self.log_msg(error)
-
-        if pre_run_success:
             try:
-                self._ping_backend()  # make sure we still have a connection
-                self._do_run()
-                do_run_success = True
-            except:
-                error = "Failed to execute do-run code:\n%s" % traceback.format_exc()
-                self.log_msg(error)
-
-        try:
-            self._ping_backend()  # make sure we still have a connection
-            self._post_run(pre_run_success, do_run_success, error)
-        except:
-            self.log_msg("Failed to execute post-run code:\n%s" % traceback.format_exc())
+                try:
+                    pre_run_success = self._pre_run()
+                    if pre_run_success:
+                        self._complete_pre_run()
+                except Exception:
+                    pre_run_success = False
+                    error = "Failed to execute pre-run code:\n%s" % traceback.format_exc()
+                    self.log_msg(error)
+
+                if pre_run_success:
+                    # make sure we still have a connection (also checks for cancellation), unless
+                    # a cancellation check just did
+                    if not self._recent_cancel_check():
+                        self._ping_backend()
+                    if self._cancel_event.is_set():
+                        # Don't start the actual work if the job was cancelled during pre-run
+                        error = "Job was cancelled before do-run"
+                        self.log_msg(error)
+                    else:
+                        try:
+                            self._do_run()
+                            do_run_success = True
+                        except Exception:
+                            error = "Failed to execute do-run code:\n%s" % traceback.format_exc()
+                            self.log_msg(error)
+
+                try:
+                    self._ping_backend()  # make sure we still have a connection
+                    self._post_run(pre_run_success, do_run_success, error)
+                except Exception:
+                    self.log_msg("Failed to execute post-run code:\n%s" % traceback.format_exc())
+            except BaseException:
+                # Interrupted (e.g. during post-run uploads) before the job was finished
+                if not self._job_finished:
+                    self._abort("Job was interrupted:\n%s" % traceback.format_exc())
+                raise
+        finally:
+            self._cleanup()
 
     def __str__(self) -> str:
         """
@@ -931,4 +1434,7 @@ class AbstractJobExecutor(Generic[ContractType]):
 
         :return: the short description
         """
-        return f"context={self.context}, workdir={self.work_dir}"
+        # The context and work directory are fixed, so only format the description once
+        if self._str is None:
+            self._str = f"context={self.context}, workdir={self.work_dir}"
+        return self._str
@@ -1,5 +1,4 @@
 from abc import ABC
-import shlex
 from typing import List, Tuple, Union
 
 from typing.io import IO
@@ -11,7 +10,7 @@ from ufdl.jobtypes.standard.server import DockerImage, DatasetInstance
 
 from .descriptors import Parameter
 from ._AbstractDockerJobExecutor import AbstractDockerJobExecutor
-from ._util import download_dataset
+from ._util import download_dataset, split_options
 
 
 class AbstractPredictJobExecutor(AbstractDockerJobExecutor[Predict], ABC):
@@ -50,16 +49,10 @@ class AbstractPredictJobExecutor(AbstractDockerJobExecutor[Predict], ABC):
                     Any additional options to the ufdl-annotations-plugin source.
         """
         # Split the source options into a list
-        options: List[str] = (
-            shlex.split(additional_source_options) if isinstance(additional_source_options, str)
-            else list(additional_source_options)
-        )
+        options: List[str] = split_options(additional_source_options)
 
         # Append the dataset options parameter
-        options += (
-            shlex.split(self.dataset_options) if isinstance(self.dataset_options, str)
-            else list(self.dataset_options)
-        )
+        options += split_options(self.dataset_options)
 
         download_dataset(
             self.context,
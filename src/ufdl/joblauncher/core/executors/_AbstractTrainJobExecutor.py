@@ -1,4 +1,3 @@
-import shlex
 from abc import ABC
 from typing import Tuple, Union
 
@@ -10,7 +9,7 @@ from ufdl.jobtypes.standard.server import DockerImage, DatasetInstance
 
 from .descriptors import Parameter
 from ._AbstractDockerJobExecutor import AbstractDockerJobExecutor
-from ._util import download_dataset
+from ._util import download_dataset, split_options
 
 
 class AbstractTrainJobExecutor(AbstractDockerJobExecutor[Train], ABC):
@@ -42,8 +41,7 @@ class AbstractTrainJobExecutor(AbstractDockerJobExecutor[Train], ABC):
             pk,
             self.template['domain'],
             output_dir,
-            shlex.split(self.dataset_options) if isinstance(self.dataset_options, str)
-            else list(self.dataset_options)
+            split_options(self.dataset_options)
         )
 
     @classmethod
@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+from ufdl.jobcontracts.base import UFDLJobContract
+from ufdl.jobcontracts.util import parse_contract
+
+from ufdl.jobtypes.base import UFDLType
+from ufdl.jobtypes.util import parse_type
+
+
+@lru_cache(maxsize=256)
+def cached_parse_contract(contract_string: str) -> UFDLJobContract:
+    """
+    Parses a job-contract string, reusing the result for strings already seen.
+    The known contracts don't change over the lifetime of the launcher, so the
+    same string always parses to the same contract.
+
+    :param contract_string: the contract string to parse
+    :return: the parsed contract
+    """
+    return parse_contract(contract_string)
+
+
+@lru_cache(maxsize=256)
+def cached_parse_type(type_string: str) -> UFDLType:
+    """
+    Parses a job-type string, reusing the result for strings already seen.
+    The known types don't change over the lifetime of the launcher, so the
+    same string always parses to the same type.
+
+    :param type_string: the type string to parse
+    :return: the parsed type
+    """
+    return parse_type(type_string)
@@ -1,5 +1,7 @@
+from functools import lru_cache
 import os
-from typing import List
+import shlex
+from typing import List, Sequence, Tuple, Union
 
 from ufdl.pythonclient import UFDLServerContext
 from ufdl.pythonclient.functional.core.dataset import clear as dataset_clear
@@ -61,3 +63,32 @@ def download_dataset(
         pipeline.process()
     finally:
         os.chdir(cwd)
+
+
+def split_options(options: Union[str, Sequence[str]]) -> List[str]:
+    """
+    Gets a list of command-line options from either a command-line string
+    or a sequence of already-split options.
+
+    :param options:
+                The options.
+    :return:
+                A new list of the options.
+    """
+    if isinstance(options, str):
+        return list(_split_options_string(options))
+    return list(options)
+
+
+@lru_cache(maxsize=64)
+def _split_options_string(options: str) -> Tuple[str, ...]:
+    """
+    Splits a command-line string into options (cached, as shlex is slow
+    and the same option strings recur for every job of a template).
+
+    :param options:
+                The command-line string.
+    :return:
+                The split options.
+    """
+    return tuple(shlex.split(options))
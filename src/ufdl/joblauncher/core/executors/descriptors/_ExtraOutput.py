@@ -11,6 +11,8 @@ class ExtraOutput(Generic[OutputType]):
     A descriptor for AbstractJobExecutor which declares an output additional
     to the contractual outputs, of the given type.
     """
+    __slots__ = ("_name", "_type")
+
     def __init__(
             self,
             type: UFDLType[tuple, Any, OutputType]
@@ -0,0 +1,77 @@
+from typing import Any, Optional, Type, Union, TYPE_CHECKING
+
+from ._ExtraOutput import ExtraOutput
+from ._Parameter import Parameter
+
+if TYPE_CHECKING:
+    from .._AbstractJobExecutor import AbstractJobExecutor
+
+
+class InstanceDescriptorProxy:
+    """
+    A data descriptor on an AbstractJobExecutor class for a name to which a
+    Parameter/ExtraOutput descriptor may be assigned per-instance (e.g. because
+    its type depends on the instance's configuration). Forwards attribute access to
+    the instance's own descriptor, so that it behaves like a class descriptor.
+    Instances without their own descriptor use the class descriptor the proxy
+    replaced (if any).
+
+    Proxies are installed when the class is created: one for each Parameter/ExtraOutput
+    declared on the class (see AbstractJobExecutor.__init_subclass__), and one declared
+    explicitly for each name only ever assigned per-instance. Assigning a descriptor to an
+    undeclared name moves the instance to a private sub-class declaring a proxy for it.
+    """
+    __slots__ = ("_name", "_fallback")
+
+    def __init__(self, name: str, fallback: Optional[Union[Parameter, ExtraOutput]] = None):
+        """
+        :param name: the attribute name the proxy is installed under
+        :param fallback: the class descriptor to use for instances without their own
+        """
+        self._name = name
+        self._fallback = fallback
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def fallback(self) -> Optional[Union[Parameter, ExtraOutput]]:
+        return self._fallback
+
+    def __get__(self, instance: Optional['AbstractJobExecutor'], owner: Type['AbstractJobExecutor']) -> Any:
+        # If called from the class, return the class descriptor (or the proxy itself if none)
+        if instance is None:
+            return self._fallback if self._fallback is not None else self
+
+        try:
+            descriptor = instance.__dict__[self._name]
+        except KeyError:
+            if self._fallback is None:
+                raise AttributeError(f"'{owner.__qualname__}' object has no attribute '{self._name}'")
+            descriptor = self._fallback
+
+        if isinstance(descriptor, Parameter):
+            return descriptor.__get__(instance, owner)
+
+        return descriptor
+
+    def __set__(self, instance: 'AbstractJobExecutor', value: Any):
+        # Assigning a descriptor replaces the class descriptor for this instance only
+        if isinstance(value, (Parameter, ExtraOutput)):
+            # Need to call __set_name__ manually
+            value.__set_name__(type(instance), self._name)
+
+            # Any value cached for a replaced parameter is stale
+            if isinstance(value, Parameter):
+                instance._parameter_value_cache.pop(self._name, None)
+
+            instance.__dict__[self._name] = value
+            return
+
+        # Setting an extra output uploads the value
+        descriptor = instance.__dict__.get(self._name, self._fallback)
+        if isinstance(descriptor, ExtraOutput):
+            return descriptor.__set__(instance, value)
+
+        instance.__dict__[self._name] = value
@@ -1,11 +1,11 @@
-from typing import Any, Generic, Optional, Tuple, Type, TypeVar, Union, overload, TYPE_CHECKING
-from weakref import WeakKeyDictionary
+from typing import Any, Dict, Generic, Optional, Tuple, Type, TypeVar, Union, overload, TYPE_CHECKING
 
 from ufdl.jobtypes.base import UFDLJSONType
-from ufdl.jobtypes.util import parse_type
 
 from wai.json.raw import RawJSONElement
 
+from .._parsing import cached_parse_type
+
 if TYPE_CHECKING:
     from .._AbstractJobExecutor import AbstractJobExecutor
 
@@ -22,6 +22,8 @@ class Parameter(Generic[ParameterType]):
     A descriptor for AbstractJobExecutor which declares a parameter
     of the given type.
     """
+    __slots__ = ("_name", "_types", "_default")
+
     def __init__(
             self,
             *types: UFDLJSONType[tuple, ParameterType, Any],
@@ -34,7 +36,6 @@ class Parameter(Generic[ParameterType]):
         self._name: Optional[str] = None
         self._types = types
         self._default = default
-        self._cache: WeakKeyDictionary = WeakKeyDictionary()
 
     @property
     def name(self) -> str:
@@ -69,7 +70,7 @@ class Parameter(Generic[ParameterType]):
             self._types,
             instance,
             self._default,
-            self._cache
+            instance._parameter_value_cache
         )
 
     @staticmethod
@@ -80,7 +81,7 @@ class Parameter(Generic[ParameterType]):
             passed_type: str
     ) -> ParameterType:
         # Parse the type of the value
-        parsed_type = parse_type(passed_type)
+        parsed_type = cached_parse_type(passed_type)
 
         # Ensure the passed type is a sub-type of an allowed type
         if not any(parsed_type.is_subtype_of(allowed_type) for allowed_type in types):
@@ -101,11 +102,11 @@ class Parameter(Generic[ParameterType]):
             types: Tuple[UFDLJSONType[tuple, ParameterType, Any], ...],
             instance: 'AbstractJobExecutor',
             default: Union[ParameterType, Type[RequiredParameter]] = RequiredParameter,
-            cache: Optional[WeakKeyDictionary] = None
+            cache: Optional[Dict[str, Any]] = None
     ) -> ParameterType:
-        # Return the cached result if any
-        if cache is not None and instance in cache:
-            return cache[instance]
+        # Return the cached result if any (the cache is per-instance, keyed by parameter name)
+        if cache is not None and name in cache:
+            return cache[name]
 
         # Try get the value from the job
         if 'parameter_values' in instance.job and name in instance.job['parameter_values']:
@@ -123,7 +124,7 @@ class Parameter(Generic[ParameterType]):
 
         # Cache the value
         if cache is not None:
-            cache[instance] = value
+            cache[name] = value
 
         return value
 
@@ -3,3 +3,4 @@ Descriptor classes for declarative-style handling of inputs/outputs/parameters.
 """
 from ._ExtraOutput import ExtraOutput
 from ._Parameter import Parameter, RequiredParameter
+from ._InstanceDescriptorProxy import InstanceDescriptorProxy
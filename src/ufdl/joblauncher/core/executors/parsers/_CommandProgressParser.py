@@ -1,5 +1,5 @@
-from abc import ABC
-from typing import Callable, Optional, Tuple
+from abc import ABC, abstractmethod
+from typing import Callable, ClassVar, Optional, Tuple
 
 from wai.json.raw import RawJSONObject
 
@@ -8,6 +8,12 @@ class CommandProgressParser(ABC):
     """
     Object which parses stdout from a running command for progress information.
     """
+    __slots__ = ()
+
+    # Whether parse never reports any progress, so the command output doesn't need parsing at all
+    noop: ClassVar[bool] = False
+
+    @abstractmethod
     def parse(
             self,
             cmd_output: str,
@@ -36,6 +42,8 @@ class CommandProgressParser(ABC):
                     The equivalent parser.
         """
         class FunctionalParser(CommandProgressParser):
+            __slots__ = ()
+
             def parse(self, cmd_output: str, last_progress: float) -> Tuple[float, Optional[RawJSONObject]]:
                 return callable(cmd_output, last_progress)
 
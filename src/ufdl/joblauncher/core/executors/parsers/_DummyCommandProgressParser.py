@@ -10,5 +10,9 @@ class DummyCommandProgressParser(CommandProgressParser):
     Dummy implementation of a command progress parser for providing feedback to the backend about the progress.
     Doesn't do anything, just returns the last progress.
     """
+    __slots__ = ()
+
+    noop = True
+
     def parse(self, cmd_output: str, last_progress: float) -> Tuple[float, Optional[RawJSONObject]]:
         return last_progress, None
@@ -0,0 +1,37 @@
+import re
+from typing import Callable, Match, Optional, Pattern, Tuple, Union
+
+from ._CommandProgressParser import CommandProgressParser
+
+from wai.json.raw import RawJSONObject
+
+
+class RegexProgressParser(CommandProgressParser):
+    """
+    Command progress parser which searches each line of output with a regular expression,
+    which is compiled once when the parser is created.
+    """
+    __slots__ = ("_re", "_convert")
+
+    def __init__(
+            self,
+            pattern: Union[str, Pattern],
+            convert: Optional[Callable[[Match], float]] = None
+    ):
+        """
+        :param pattern: the regular expression to search each line with
+        :param convert: gets the progress (0-1) from a match. Defaults to the float
+                        value of the first group in the pattern
+        """
+        self._re: Pattern = re.compile(pattern)
+        self._convert = convert if convert is not None else RegexProgressParser._first_group
+
+    @staticmethod
+    def _first_group(match: Match) -> float:
+        return float(match.group(1))
+
+    def parse(self, cmd_output: str, last_progress: float) -> Tuple[float, Optional[RawJSONObject]]:
+        match = self._re.search(cmd_output)
+        if match is None:
+            return last_progress, None
+        return self._convert(match), None
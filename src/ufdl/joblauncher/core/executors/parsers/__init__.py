@@ -1,2 +1,3 @@
 from ._CommandProgressParser import CommandProgressParser
 from ._DummyCommandProgressParser import DummyCommandProgressParser
+from ._RegexProgressParser import RegexProgressParser
@@ -21,8 +21,10 @@ class Simple(Poller):
     ) -> AbstractJobExecutor:
         result = None
         sleep = SleepSchedule(config.poll_simple.interval, debug=debug, debug_msg="Waiting for %s seconds before next poll")
+        # The filter is the same for every poll, so only generate it once
+        filter_spec = generate_filter(debug=debug)
         while result is None:
-            jobs = list_jobs(context, filter_spec=generate_filter(debug=debug))
+            jobs = list_jobs(context, filter_spec=filter_spec)
             for job in jobs:
                 result = job_prepper.prepare_job(job)
                 if result is not None:
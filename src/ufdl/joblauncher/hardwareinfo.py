@@ -1,4 +1,5 @@
 import argparse
+from dataclasses import asdict
 import json
 import traceback
 from typing import Callable, Dict, List, Optional
@@ -10,9 +11,13 @@ from ufdl.pythonclient import UFDLServerContext
 from ufdl.joblauncher.core import create_server_context, HardwareInfo
 from ufdl.joblauncher.core.config import SYSTEMWIDE_CONFIG, UFDLJobLauncherConfig
 
+# Use libyaml's dumper if PyYAML was built with it
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# N.B. the hardware info is a dataclass, so is converted to plain dicts/lists for output
 SUPPORTED_OUT_FORMATS: Dict[str, Callable[[HardwareInfo], str]] = {
-    "json": lambda info: json.dumps(info, indent=2),
-    "yaml": yaml.dump
+    "json": lambda info: json.dumps(asdict(info), indent=2),
+    "yaml": lambda info: yaml.dump(asdict(info), Dumper=_YAML_DUMPER)
 }
 
 